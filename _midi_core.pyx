@@ -0,0 +1,40 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+# Compiled version of the note event loop in server.emit_midi.
+# Build it with `python setup.py build_ext --inplace`; server.py falls back to the
+# pure-Python _encode_note_events when it isn't built. Both must produce identical bytes.
+
+cdef inline void _write_vlq(bytearray out, unsigned long long value):
+    # MIDI variable-length quantity: 7 bits per byte, high bit set on all but the last
+    cdef unsigned char tmp[10]
+    cdef int n = 1
+    tmp[0] = value & 0x7F
+    value >>= 7
+    while value:
+        tmp[n] = (value & 0x7F) | 0x80
+        value >>= 7
+        n += 1
+    while n:
+        n -= 1
+        out.append(tmp[n])
+
+cpdef bytes encode_note_events(list events):
+    cdef bytearray out = bytearray()
+    cdef long long start_tick, duration_tick, delta
+    cdef long long last_tick = 0
+    cdef int pitch, velocity
+    for event in events:
+        start_tick, duration_tick, pitch, velocity = event
+        # Calculate delta time
+        delta = start_tick - last_tick
+        if delta < 0:
+            delta = 0
+        _write_vlq(out, delta)
+        out.append(0x90)
+        out.append(pitch)
+        out.append(velocity)
+        _write_vlq(out, duration_tick)
+        out.append(0x80)
+        out.append(pitch)
+        out.append(0)
+        last_tick = start_tick + duration_tick
+    return bytes(out)
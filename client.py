@@ -1,12 +1,57 @@
+import threading
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk
+from dataclasses import dataclass
 import requests
+from requests.adapters import HTTPAdapter
+
+@dataclass(frozen=True)
+class OutputConfig:
+    label: str
+    endpoint: str
+    ext: str
+    filetypes: tuple
+    default_name: str
+
+CONFIGS = {
+    cfg.label: cfg for cfg in (
+        OutputConfig(
+            label="MIDI File (.mid)",
+            endpoint="http://localhost:8000/generate/midi",
+            ext=".mid",
+            filetypes=(("MIDI files", "*.mid"),),
+            default_name="generated_ai_midi.mid"
+        ),
+        OutputConfig(
+            label="Serum Preset (.fxp)",
+            endpoint="http://localhost:8000/generate/fxp",
+            ext=".fxp",
+            filetypes=(("Serum Preset files", "*.fxp"),),
+            default_name="generated_serum_preset.fxp"
+        ),
+        OutputConfig(
+            label="3xOsc Preset (.fst)",
+            endpoint="http://localhost:8000/generate/3xosc-fst",
+            ext=".fst",
+            filetypes=(("3xOsc Preset files", "*.fst"),),
+            default_name="generated_3xosc_preset.fst"
+        ),
+    )
+}
+
+# (connect, read) timeouts in seconds. The server sends nothing until a generation finishes
+# and gives up after LM_TIMEOUT (120 s), so read a little longer to receive its 504 message
+REQUEST_TIMEOUT = (3.05, 150)
 
 class FLStudioLLMClient:
     def __init__(self):
         self.root = tk.Tk()
         self.root.title("FL Studio LLM")
         self.root.geometry("500x340")
+
+        # Reuse one keep-alive connection pool for all requests to the server
+        self.session = requests.Session()
+        self.session.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
         
         main_frame = ttk.Frame(self.root, padding="10")
         main_frame.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
@@ -16,15 +61,12 @@ class FLStudioLLMClient:
         self.text_input.grid(row=1, column=0, pady=5)
         
         ttk.Label(main_frame, text="Output type:").grid(row=2, column=0, sticky=tk.W)
-        self.output_type = ttk.Combobox(main_frame, values=[
-            "MIDI File (.mid)",
-            "Serum Preset (.fxp)",
-            "3xOsc Preset (.fst)"
-        ])
+        self.output_type = ttk.Combobox(main_frame, values=list(CONFIGS))
         self.output_type.grid(row=3, column=0, pady=5)
         self.output_type.set("MIDI File (.mid)")
         
-        ttk.Button(main_frame, text="Generate", command=self.generate).grid(row=4, column=0, pady=10)
+        self.generate_button = ttk.Button(main_frame, text="Generate", command=self.generate)
+        self.generate_button.grid(row=4, column=0, pady=10)
         
         self.status_label = ttk.Label(main_frame, text="")
         self.status_label.grid(row=5, column=0, pady=5)
@@ -35,32 +77,34 @@ class FLStudioLLMClient:
         if not text:
             self.status_label.config(text="Please enter some text")
             return
+        cfg = CONFIGS.get(output_type)
+        if cfg is None:
+            self.status_label.config(text="Unknown output type selected.")
+            return
         self.status_label.config(text=f"Generating {output_type}...")
+        # One request at a time; the button comes back once the response or error is handled
+        self.generate_button.state(["disabled"])
+        # Run the request off the Tk main thread so the window stays responsive
+        threading.Thread(target=self._do_request, args=(cfg, text), daemon=True).start()
+
+    def _do_request(self, cfg, text):
+        try:
+            response = self.session.post(cfg.endpoint, json={"text": text, "no_cache": True}, timeout=REQUEST_TIMEOUT)
+        except Exception as e:
+            self.root.after(0, self._on_error, e)
+            return
+        self.root.after(0, self._on_response, response, cfg)
+
+    def _on_response(self, response, cfg):
+        # Dialog modules are only needed once a response arrives, so import them lazily
+        from tkinter import filedialog, messagebox
+        output_type = cfg.label
         try:
-            if output_type == "MIDI File (.mid)":
-                endpoint = "http://localhost:8000/generate/midi"
-                filetypes = [("MIDI files", "*.mid")]
-                default_ext = ".mid"
-                default_name = "generated_ai_midi.mid"
-            elif output_type == "Serum Preset (.fxp)":
-                endpoint = "http://localhost:8000/generate/fxp"
-                filetypes = [("Serum Preset files", "*.fxp")]
-                default_ext = ".fxp"
-                default_name = "generated_serum_preset.fxp"
-            elif output_type == "3xOsc Preset (.fst)":
-                endpoint = "http://localhost:8000/generate/3xosc-fst"
-                filetypes = [("3xOsc Preset files", "*.fst")]
-                default_ext = ".fst"
-                default_name = "generated_3xosc_preset.fst"
-            else:
-                self.status_label.config(text="Unknown output type selected.")
-                return
-            response = requests.post(endpoint, json={"text": text})
             if response.status_code == 200:
                 file_path = filedialog.asksaveasfilename(
-                    defaultextension=default_ext,
-                    filetypes=filetypes,
-                    initialfile=default_name
+                    defaultextension=cfg.ext,
+                    filetypes=cfg.filetypes,
+                    initialfile=cfg.default_name
                 )
                 if file_path:
                     with open(file_path, "wb") as f:
@@ -73,8 +117,15 @@ class FLStudioLLMClient:
                 self.status_label.config(text=f"Error: {response.status_code}")
                 messagebox.showerror("Error", f"Server error: {response.text}")
         except Exception as e:
-            self.status_label.config(text=f"Error: {str(e)}")
-            messagebox.showerror("Error", str(e))
+            self._on_error(e)
+        finally:
+            self.generate_button.state(["!disabled"])
+
+    def _on_error(self, e):
+        from tkinter import messagebox
+        self.generate_button.state(["!disabled"])
+        self.status_label.config(text=f"Error: {str(e)}")
+        messagebox.showerror("Error", str(e))
     
     def run(self):
         self.root.mainloop()
@@ -1,25 +1,74 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse, Response
+from pydantic import BaseModel, Field, ValidationError, field_validator
 import uvicorn
 import mido
 import os
-from typing import Optional
-import requests
+import asyncio
+from typing import Optional, List, Literal, Tuple
+from collections import OrderedDict
+from functools import lru_cache
+import httpx
+import anyio.to_thread
 import json
+import io
 import logging
 import re
+import operator
+from itertools import islice
 import struct
-import zlib
-from tempfile import NamedTemporaryFile
+import zipfile
 import shutil
 
 # Set up logging
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# zlib-ng is a faster drop-in for the stdlib zlib module when it is installed
+try:
+    from zlib_ng import zlib_ng as zlib
+except ImportError:
+    import zlib
+
+# Prefer orjson on the hot JSON paths, falling back to the stdlib when it isn't installed.
+# Both loaders raise a json.JSONDecodeError subclass, and json_dumps always returns bytes.
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+    DefaultResponse = ORJSONResponse
+except ImportError:
+    json_loads = json.loads
+    DefaultResponse = JSONResponse
+
+    def json_dumps(obj) -> bytes:
+        return json.dumps(obj).encode()
+
+# Upper bound (seconds) on a single LM Studio generation
+LM_TIMEOUT = 120
+
+# Output token budgets per generation type; generation time grows with max_tokens
+MIDI_MAX_TOK = 2048
+SERUM_MAX_TOK = 1536
+OSC_MAX_TOK = 512
+
+# Shared async client so calls to LM Studio reuse keep-alive connections
+# without blocking the event loop
+LM_CLIENT = httpx.AsyncClient(
+    base_url="http://localhost:1234",
+    # Loopback bandwidth is free, so ask LM Studio not to compress responses
+    headers={"Connection": "keep-alive", "Accept-Encoding": "identity"},
+    timeout=httpx.Timeout(LM_TIMEOUT, connect=3.05),
+    limits=httpx.Limits(max_keepalive_connections=20, max_connections=40)
+)
+
+app = FastAPI(default_response_class=DefaultResponse)
+
+@app.on_event("shutdown")
+async def close_lm_client():
+    await LM_CLIENT.aclose()
 
 # Enable CORS
 app.add_middleware(
@@ -30,24 +79,77 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Only the JSON-returning endpoints are worth compressing; MIDI/FXP/FST/zip downloads are
+# small or already dense binaries, so they skip gzip entirely
+GZIP_PATHS = frozenset({"/generate"})
+
+class JSONGZipMiddleware(GZipMiddleware):
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"] in GZIP_PATHS:
+            await super().__call__(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+app.add_middleware(JSONGZipMiddleware, minimum_size=4096, compresslevel=5)
+
 class TextRequest(BaseModel):
     text: str
     output_type: Optional[str] = None  # For legacy endpoints
+    no_cache: bool = False  # Generate a fresh variation instead of reusing a cached result
 
-def clean_json_response(response: str) -> str:
-    # Remove markdown code block syntax
-    response = re.sub(r'```json\n?', '', response)
-    response = re.sub(r'\n?```$', '', response)
-    # Remove any leading/trailing whitespace
-    response = response.strip()
-    return response
+class LegacyTextRequest(TextRequest):
+    # Only /generate dispatches on output_type, so only it restricts the values
+    output_type: Optional[Literal["midi", "serum"]] = None
 
-def strip_json_comments(s: str) -> str:
-    # Remove // comments
-    return re.sub(r'//.*', '', s)
+class BatchRequest(BaseModel):
+    text: str
+    n: int = Field(default=4, ge=1, le=100)
 
-def generate_midi_prompt(text: str) -> str:
-    return f"""Generate a {text} as a 16-bar MIDI pattern in JSON format.
+class Note(BaseModel, frozen=True, extra='ignore'):
+    pitch: int = Field(ge=0, le=127)
+    velocity: int = Field(ge=0, le=127)
+    duration: float = Field(default=1.0, ge=0)
+    start: float = Field(default=0.0, ge=0)
+
+class MidiDoc(BaseModel):
+    tempo: float = Field(default=120, gt=0)
+    time_signature: Tuple[int, int] = (4, 4)
+    notes: List[Note]
+
+    @field_validator('tempo')
+    @classmethod
+    def tempo_fits_midi(cls, tempo: float) -> float:
+        # set_tempo stores microseconds per beat in 3 bytes, which rules out very slow tempos
+        if mido.bpm2tempo(tempo) > 0xFFFFFF:
+            raise ValueError(f"tempo too slow to encode: {tempo} BPM")
+        return tempo
+
+    @field_validator('time_signature')
+    @classmethod
+    def time_signature_fits_midi(cls, ts: Tuple[int, int]) -> Tuple[int, int]:
+        # The numerator is stored as a byte and the denominator as a power-of-2 exponent
+        numerator, denominator = ts
+        if not 0 <= numerator <= 255:
+            raise ValueError(f"time signature numerator out of range: {numerator}")
+        if denominator <= 0 or denominator & (denominator - 1) or denominator.bit_length() > 256:
+            raise ValueError(f"time signature denominator must be a power of 2: {denominator}")
+        return ts
+
+# Markdown code fences and // comments, stripped in a single pass. JSON strings are
+# matched first and kept, so values like "http://..." are not cut at the //
+_CLEAN_RE = re.compile(r'(?m)("(?:\\.|[^"\\\n])*")|//[^\n]*|```(?:json)?\n?|\n?```\s*$')
+
+def clean_json_response(response: str) -> str:
+    # Remove markdown code block syntax and // comments, then keep only the outermost
+    # JSON object so any prose the model adds around it is dropped
+    response = _CLEAN_RE.sub(lambda m: m.group(1) or '', response)
+    start = response.find('{')
+    end = response.rfind('}')
+    if start == -1 or end < start:
+        return response.strip()
+    return response[start:end + 1]
+
+_MIDI_TMPL = """Generate a {text} as a 16-bar MIDI pattern in JSON format.
 Only output valid JSON. Do not include comments or explanations.
 Include as many notes as possible for a full 16-bar sequence.
 Format:
@@ -60,8 +162,11 @@ Format:
 }}
 """
 
-def generate_serum_prompt(text: str) -> str:
-    return f"""Generate a Serum preset in JSON format based on: {text}
+@lru_cache(maxsize=512)
+def generate_midi_prompt(text: str) -> str:
+    return _MIDI_TMPL.format(text=text)
+
+_SERUM_TMPL = """Generate a Serum preset in JSON format based on: {text}
 
 Format:
 {{
@@ -148,210 +253,415 @@ Format:
     }}
 }}"""
 
-def create_fxp_file(preset_data: dict, output_path: str) -> bool:
+@lru_cache(maxsize=512)
+def generate_serum_prompt(text: str) -> str:
+    return _SERUM_TMPL.format(text=text)
+
+# Preset blobs smaller than this are stored rather than deflated
+FXP_STORE_THRESHOLD = 4096
+
+# Size of the slices fed to the streaming compressor
+FXP_CHUNK_SIZE = 16384
+
+# Precompiled FXP data length layout
+_FXP_LEN = struct.Struct('>i')
+
+# Every FXP header field except the trailing 28-byte preset name is constant, so pack them once
+_FXP_HEADER_PREFIX = struct.pack('>4si4si4sii',
+    b'CcnK',  # Magic number
+    0xfc6,    # Header length
+    b'FPCh',  # Format identifier
+    1,        # Version
+    b'XfsX',  # Serum identifier
+    1,        # Format version
+    1         # Number of programs
+)
+
+def create_fxp_file(preset_data: dict, fp) -> bool:
     try:
         # Convert the preset data to a binary format that Serum expects
         # This is a simplified version - we'll need to map our parameters to Serum's format
-        preset_name = preset_data.get("preset_name", "Untitled")[:28].ljust(28, '\0')
+        preset_name = preset_data.get("preset_name", "Untitled")[:28].ljust(28, '\0').encode('latin-1', 'replace')
         
-        # Create the FXP header
-        header = struct.pack('>4si4si4sii28s',
-            b'CcnK',  # Magic number
-            0xfc6,    # Header length
-            b'FPCh',  # Format identifier
-            1,        # Version
-            b'XfsX',  # Serum identifier
-            1,        # Format version
-            1,        # Number of programs
-            preset_name.encode()  # Preset name
-        )
+        # Create the FXP header (preset_name is exactly 28 bytes: one latin-1 byte per padded char)
+        header = _FXP_HEADER_PREFIX + preset_name
         
         # Convert preset data to binary format
         # This is where we need to map our parameters to Serum's binary format
         # For now, we'll just JSON encode and compress it
-        preset_bytes = json.dumps(preset_data).encode()
-        compressed_data = zlib.compress(preset_bytes)
+        # Small presets are stored uncompressed (level 0), larger ones use the fastest level
+        preset_bytes = json_dumps(preset_data)
+        level = 0 if len(preset_bytes) < FXP_STORE_THRESHOLD else 1
         
-        # Write the file
-        with open(output_path, 'wb') as f:
-            f.write(header)
-            f.write(struct.pack('>i', len(compressed_data)))  # Data length
-            f.write(compressed_data)
+        # Write the file, streaming the compressed data and patching its length in afterwards
+        fp.write(header)
+        length_pos = fp.tell()
+        fp.write(_FXP_LEN.pack(0))  # Data length placeholder
+        co = zlib.compressobj(level)
+        view = memoryview(preset_bytes)
+        data_len = 0
+        for i in range(0, len(view), FXP_CHUNK_SIZE):
+            chunk = co.compress(view[i:i + FXP_CHUNK_SIZE])
+            fp.write(chunk)
+            data_len += len(chunk)
+        chunk = co.flush()
+        fp.write(chunk)
+        data_len += len(chunk)
+        end_pos = fp.tell()
+        fp.seek(length_pos)
+        fp.write(_FXP_LEN.pack(data_len))
+        fp.seek(end_pos)
         
         return True
     except Exception as e:
         logger.error(f"Failed to create FXP file: {str(e)}")
         return False
 
-def json_to_midi(midi_data, output_path):
-    try:
-        mid = mido.MidiFile()
-        track = mido.MidiTrack()
-        mid.tracks.append(track)
-
-        # Set tempo
-        tempo = mido.bpm2tempo(midi_data.get('tempo', 120))
-        track.append(mido.MetaMessage('set_tempo', tempo=tempo))
-
-        # Set time signature
-        ts = midi_data.get('time_signature', [4, 4])
-        track.append(mido.MetaMessage('time_signature', numerator=ts[0], denominator=ts[1]))
-
-        # Add notes
-        ticks_per_beat = mid.ticks_per_beat
-        last_tick = 0
-        for note in sorted(midi_data['notes'], key=lambda n: n.get('start', 0)):
-            start_tick = int(note.get('start', 0) * ticks_per_beat)
-            duration_tick = int(note.get('duration', 1) * ticks_per_beat)
-            pitch = note['pitch']
-            velocity = note['velocity']
-            # Calculate delta time
-            delta = max(0, start_tick - last_tick)
-            track.append(mido.Message('note_on', note=pitch, velocity=velocity, time=delta))
-            track.append(mido.Message('note_off', note=pitch, velocity=0, time=duration_tick))
-            last_tick = start_tick + duration_tick
-        mid.save(output_path)
-        return True
-    except Exception as e:
-        logger.error(f"Failed to create MIDI file: {str(e)}")
-        return False
+# Same resolution mido.MidiFile uses by default
+MIDI_TICKS_PER_BEAT = 480
 
-async def call_lm_studio(prompt: str) -> str:
-    try:
-        logger.debug(f"Sending prompt to LM Studio: {prompt}")
-        response = requests.post(
-            "http://localhost:1234/v1/chat/completions",
-            json={
-                "model": "gemma-3-27b-it-qat",
-                "messages": [{"role": "user", "content": prompt}],
-                "temperature": 0.3,
-                "max_tokens": 3072
-            }
-        )
-        logger.debug(f"LM Studio response status: {response.status_code}")
-        logger.debug(f"LM Studio response: {response.text}")
+_MIDI_HEADER = struct.Struct('>4sLhhh')
+_MIDI_CHUNK = struct.Struct('>4sL')
+
+def _encode_vlq(value: int) -> bytes:
+    # MIDI variable-length quantity: 7 bits per byte, high bit set on all but the last
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+def _encode_note_events(events) -> bytes:
+    # Pure-Python fallback for _midi_core.encode_note_events
+    track = bytearray()
+    last_tick = 0
+    for start_tick, duration_tick, pitch, velocity in events:
+        # Calculate delta time
+        delta = max(0, start_tick - last_tick)
+        track += _encode_vlq(delta)
+        track += bytes((0x90, pitch, velocity))
+        track += _encode_vlq(duration_tick)
+        track += bytes((0x80, pitch, 0))
+        last_tick = start_tick + duration_tick
+    return bytes(track)
+
+# Use the compiled note encoder when it has been built (python setup.py build_ext --inplace),
+# otherwise the pure-Python loop. It is built ahead of time rather than on import so that
+# several uvicorn workers starting at once don't race to compile it
+try:
+    from _midi_core import encode_note_events
+    logger.info("Using compiled MIDI note encoder")
+except ImportError:
+    encode_note_events = _encode_note_events
+    logger.info("Using pure-Python MIDI note encoder; build _midi_core with 'python setup.py build_ext --inplace' for the compiled one")
+
+def emit_midi(events, tempo: int, ts, tpb: int = MIDI_TICKS_PER_BEAT) -> bytes:
+    """Build a single-track (type 1) MIDI file from (start_tick, duration_tick, pitch, velocity) events.
+
+    Produces the same bytes mido.MidiFile.save would for the equivalent track, without
+    creating a Message object per note. Tempo and time signature ranges are checked by
+    MidiDoc before anything reaches here.
+    """
+    numerator, denominator = ts
+    track = bytearray()
+    # set_tempo and time_signature meta events at delta 0
+    track += b'\x00\xff\x51\x03' + tempo.to_bytes(3, 'big')
+    track += bytes((0, 0xFF, 0x58, 4, numerator, denominator.bit_length() - 1, 24, 8))
+    track += encode_note_events(events)
+    # End of track
+    track += b'\x00\xff\x2f\x00'
+    return _MIDI_HEADER.pack(b'MThd', 6, 1, 1, tpb) + _MIDI_CHUNK.pack(b'MTrk', len(track)) + track
+
+def json_to_midi(doc: MidiDoc, fp):
+    tempo = mido.bpm2tempo(doc.tempo)
+
+    # Add notes in start order; LLM output is usually already sorted, so only sort when needed
+    notes = doc.notes
+    if any(a.start > b.start for a, b in zip(notes, islice(notes, 1, None))):
+        notes.sort(key=operator.attrgetter('start'))
+    ticks_per_beat = MIDI_TICKS_PER_BEAT
+    # Convert to (start_tick, duration_tick, pitch, velocity) up front so the emit loop only does arithmetic
+    events = [
+        (int(note.start * ticks_per_beat), int(note.duration * ticks_per_beat), note.pitch, note.velocity)
+        for note in notes
+    ]
+    fp.write(emit_midi(events, tempo, doc.time_signature, ticks_per_beat))
+
+async def _stream_lm_studio(prompt: str, max_tokens: int) -> str:
+    # Consume the OpenAI-compatible SSE stream, collecting content deltas as they arrive
+    parts = []
+    async with LM_CLIENT.stream(
+        "POST",
+        "/v1/chat/completions",
+        json={
+            "model": "gemma-3-27b-it-qat",
+            "messages": [{"role": "user", "content": prompt}],
+            "temperature": 0.3,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+    ) as response:
+        logger.debug("LM Studio response status: %s", response.status_code)
+        if response.is_error:
+            await response.aread()
         response.raise_for_status()
-        return response.json()["choices"][0]["message"]["content"]
-    except requests.exceptions.ConnectionError as e:
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            content = json_loads(payload)["choices"][0]["delta"].get("content")
+            if content:
+                parts.append(content)
+    return "".join(parts)
+
+async def _request_lm_studio(prompt: str, max_tokens: int) -> str:
+    try:
+        logger.debug("Sending prompt to LM Studio: %s", prompt)
+        content = await asyncio.wait_for(_stream_lm_studio(prompt, max_tokens), timeout=LM_TIMEOUT)
+        logger.debug("LM Studio response: %s", content)
+        return content
+    except httpx.ConnectError as e:
         logger.error(f"Failed to connect to LM Studio: {str(e)}")
         raise HTTPException(status_code=503, detail="LM Studio is not running or not accessible. Please make sure it's running on port 1234.")
+    except (asyncio.TimeoutError, httpx.TimeoutException) as e:
+        logger.error(f"Timed out waiting for LM Studio: {str(e)}")
+        raise HTTPException(status_code=504, detail=f"LM Studio did not respond within {LM_TIMEOUT} seconds.")
     except Exception as e:
         logger.error(f"Error calling LM Studio: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error calling LM Studio: {str(e)}")
 
-@app.post("/generate/midi")
+# In-flight requests, so concurrent identical prompts share a single LM Studio call.
+# Finished responses are not cached here: a reply is only known to be usable once the
+# caller has parsed it, and successful builds are cached by cached_result instead
+_LM_INFLIGHT = {}
+
+async def call_lm_studio(prompt: str, max_tokens: int) -> str:
+    pending = _LM_INFLIGHT.get(prompt)
+    if pending is not None:
+        try:
+            return await asyncio.shield(pending)
+        except asyncio.CancelledError:
+            # A cancelled shared future means the leader's request was cancelled, not ours,
+            # so retry instead; waiting followers coalesce again behind whoever goes first
+            if not pending.cancelled():
+                raise
+            logger.debug("Shared LM Studio call was cancelled, retrying")
+            return await call_lm_studio(prompt, max_tokens)
+    future = asyncio.get_running_loop().create_future()
+    _LM_INFLIGHT[prompt] = future
+    try:
+        content = await _request_lm_studio(prompt, max_tokens)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Mark retrieved in case nobody else was waiting
+        raise
+    finally:
+        del _LM_INFLIGHT[prompt]
+    future.set_result(content)
+    return content
+
+# Capped LRU of (endpoint, text) -> generated file bytes, so repeated requests
+# skip the LLM call, parsing and file assembly entirely
+RESULT_CACHE_SIZE = 256
+_RESULT_CACHE = OrderedDict()
+
+async def cached_result(endpoint: str, text: str, build, no_cache: bool = False) -> bytes:
+    key = (endpoint, text)
+    # no_cache skips the lookup but still stores the new result for later plain requests
+    cached = None if no_cache else _RESULT_CACHE.get(key)
+    if cached is not None:
+        _RESULT_CACHE.move_to_end(key)
+        logger.debug("Result cache hit for %s", endpoint)
+        return cached
+    result = await build(text)
+    _RESULT_CACHE[key] = result
+    if len(_RESULT_CACHE) > RESULT_CACHE_SIZE:
+        _RESULT_CACHE.popitem(last=False)
+    return result
+
+async def _midi_bytes(text: str) -> bytes:
+    prompt = generate_midi_prompt(text)
+    logger.debug("Generated MIDI prompt: %s", prompt)
+    ai_response = await call_lm_studio(prompt, MIDI_MAX_TOK)
+    logger.debug("AI response: %s", ai_response)
+    try:
+        cleaned_response = clean_json_response(ai_response)
+        logger.debug("Cleaned response (no comments): %s", cleaned_response)
+        midi_doc = MidiDoc.model_validate_json(cleaned_response)
+        logger.debug("Parsed MIDI data: %s", midi_doc)
+    except (json.JSONDecodeError, ValidationError) as e:
+        logger.error(f"Failed to parse AI response as JSON: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
+    buf = io.BytesIO()
+    await anyio.to_thread.run_sync(json_to_midi, midi_doc, buf)
+    return buf.getvalue()
+
+@app.post("/generate/midi", response_model=None)
 async def generate_midi(request: TextRequest):
+    return Response(
+        await cached_result("midi", request.text, _midi_bytes, request.no_cache),
+        media_type="audio/midi",
+        headers={"Content-Disposition": 'attachment; filename="generated_ai_midi.mid"'}
+    )
+
+# Max concurrent LM Studio calls per batch request
+LM_BATCH_CONCURRENCY = 4
+
+# Overall deadline (seconds) for a batch; items still running are cancelled and skipped
+LM_BATCH_TIMEOUT = 300
+
+@app.post("/generate/midi/batch", response_model=None)
+async def generate_midi_batch(request: BatchRequest):
     prompt = generate_midi_prompt(request.text)
-    logger.debug(f"Generated MIDI prompt: {prompt}")
-    ai_response = await call_lm_studio(prompt)
-    logger.debug(f"AI response: {ai_response}")
+    logger.debug("Generated MIDI batch prompt (n=%s): %s", request.n, prompt)
+    sem = asyncio.Semaphore(LM_BATCH_CONCURRENCY)
+
+    # Bypass in-flight coalescing, otherwise every sample would share one response
+    async def one():
+        async with sem:
+            return await _request_lm_studio(prompt, MIDI_MAX_TOK)
+
+    tasks = [asyncio.ensure_future(one()) for _ in range(request.n)]
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=LM_BATCH_TIMEOUT)
+    finally:
+        # Don't leave calls running against LM Studio once the response is decided
+        for task in tasks:
+            task.cancel()
+    if pending:
+        logger.error(f"Batch deadline of {LM_BATCH_TIMEOUT}s reached, skipping {len(pending)} unfinished items")
+    buf = io.BytesIO()
+    written = 0
+    # MIDI data barely compresses, so store entries as-is
+    with zipfile.ZipFile(buf, 'w', zipfile.ZIP_STORED) as zf:
+        for i, task in enumerate(tasks, 1):
+            if task not in done or task.cancelled():
+                continue
+            exc = task.exception()
+            if exc is not None:
+                logger.error(f"Skipping batch item {i}, LM Studio call failed: {getattr(exc, 'detail', None) or str(exc)}")
+                continue
+            ai_response = task.result()
+            try:
+                midi_doc = MidiDoc.model_validate_json(clean_json_response(ai_response))
+            except (json.JSONDecodeError, ValidationError) as e:
+                logger.error(f"Skipping batch item {i}, invalid JSON response from AI: {str(e)}")
+                continue
+            midi_buf = io.BytesIO()
+            await anyio.to_thread.run_sync(json_to_midi, midi_doc, midi_buf)
+            zf.writestr(f"generated_ai_midi_{i:03d}.mid", midi_buf.getvalue())
+            written += 1
+    if not written:
+        raise HTTPException(status_code=500, detail="Failed to create any MIDI files")
+    return Response(
+        buf.getvalue(),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="generated_ai_midi.zip"'}
+    )
+
+async def _legacy_midi(text: str) -> dict:
+    prompt = generate_midi_prompt(text)
+    logger.debug("Generated MIDI prompt: %s", prompt)
+    ai_response = await call_lm_studio(prompt, MIDI_MAX_TOK)
+    logger.debug("AI response: %s", ai_response)
+    
     try:
         cleaned_response = clean_json_response(ai_response)
-        cleaned_response = strip_json_comments(cleaned_response)
-        logger.debug(f"Cleaned response (no comments): {cleaned_response}")
-        midi_data = json.loads(cleaned_response)
-        logger.debug(f"Parsed MIDI data: {midi_data}")
-        with NamedTemporaryFile(delete=False, suffix='.mid') as tmpfile:
-            if json_to_midi(midi_data, tmpfile.name):
-                tmpfile.flush()
-                return FileResponse(
-                    tmpfile.name,
-                    media_type="audio/midi",
-                    filename="generated_ai_midi.mid"
-                )
-            else:
-                raise HTTPException(status_code=500, detail="Failed to create MIDI file")
+        logger.debug("Cleaned response (no comments): %s", cleaned_response)
+        # Keep the parsed dict for the response so "data" echoes the model's JSON as before
+        midi_data = json_loads(cleaned_response)
+        logger.debug("Parsed MIDI data: %s", midi_data)
+        midi_doc = MidiDoc.model_validate(midi_data)
+        output_path = os.path.expanduser("~/Documents/generated_ai_midi.mid")
+        with open(output_path, 'wb') as f:
+            await anyio.to_thread.run_sync(json_to_midi, midi_doc, f)
+        return {"status": "success", "type": "midi", "data": midi_data, "file_path": output_path}
+    except (json.JSONDecodeError, ValidationError) as e:
+        logger.error(f"Failed to parse AI response as JSON: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
+
+async def _legacy_serum(text: str) -> dict:
+    prompt = generate_serum_prompt(text)
+    logger.debug("Generated Serum prompt: %s", prompt)
+    ai_response = await call_lm_studio(prompt, SERUM_MAX_TOK)
+    logger.debug("AI response: %s", ai_response)
+    
+    try:
+        cleaned_response = clean_json_response(ai_response)
+        logger.debug("Cleaned response: %s", cleaned_response)
+        serum_data = json_loads(cleaned_response)
+        logger.debug("Parsed Serum data: %s", serum_data)
+        
+        # Generate FXP file
+        output_path = os.path.expanduser("~/Documents/serum_preset.fxp")
+        with open(output_path, 'wb') as f:
+            fxp_ok = await anyio.to_thread.run_sync(create_fxp_file, serum_data, f)
+        if fxp_ok:
+            return {
+                "status": "success",
+                "type": "serum",
+                "data": serum_data,
+                "file_path": output_path
+            }
+        else:
+            raise HTTPException(status_code=500, detail="Failed to create FXP file")
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse AI response as JSON: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
 
+LEGACY_GENERATORS = {
+    "midi": _legacy_midi,
+    "serum": _legacy_serum,
+}
+
 # (Legacy endpoint for backward compatibility)
 @app.post("/generate")
-async def generate_content(request: TextRequest):
+async def generate_content(request: LegacyTextRequest):
     try:
-        logger.debug(f"Received request: {request}")
-        
-        if request.output_type == "midi":
-            prompt = generate_midi_prompt(request.text)
-            logger.debug(f"Generated MIDI prompt: {prompt}")
-            ai_response = await call_lm_studio(prompt)
-            logger.debug(f"AI response: {ai_response}")
-            
-            try:
-                cleaned_response = clean_json_response(ai_response)
-                cleaned_response = strip_json_comments(cleaned_response)
-                logger.debug(f"Cleaned response (no comments): {cleaned_response}")
-                midi_data = json.loads(cleaned_response)
-                logger.debug(f"Parsed MIDI data: {midi_data}")
-                output_path = os.path.expanduser("~/Documents/generated_ai_midi.mid")
-                if json_to_midi(midi_data, output_path):
-                    return {"status": "success", "type": "midi", "data": midi_data, "file_path": output_path}
-                else:
-                    raise HTTPException(status_code=500, detail="Failed to create MIDI file")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse AI response as JSON: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
-                
-        elif request.output_type == "serum":
-            prompt = generate_serum_prompt(request.text)
-            logger.debug(f"Generated Serum prompt: {prompt}")
-            ai_response = await call_lm_studio(prompt)
-            logger.debug(f"AI response: {ai_response}")
-            
-            try:
-                cleaned_response = clean_json_response(ai_response)
-                logger.debug(f"Cleaned response: {cleaned_response}")
-                serum_data = json.loads(cleaned_response)
-                logger.debug(f"Parsed Serum data: {serum_data}")
-                
-                # Generate FXP file
-                output_path = os.path.expanduser("~/Documents/serum_preset.fxp")
-                if create_fxp_file(serum_data, output_path):
-                    return {
-                        "status": "success",
-                        "type": "serum",
-                        "data": serum_data,
-                        "file_path": output_path
-                    }
-                else:
-                    raise HTTPException(status_code=500, detail="Failed to create FXP file")
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse AI response as JSON: {str(e)}")
-                raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
-        else:
+        logger.debug("Received request: %s", request)
+        generator = LEGACY_GENERATORS.get(request.output_type)
+        if generator is None:
             logger.error(f"Invalid output type: {request.output_type}")
             raise HTTPException(status_code=400, detail="Invalid output type")
+        return await generator(request.text)
     except Exception as e:
         logger.error(f"Unexpected error: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/generate/fxp")
-async def generate_fxp(request: TextRequest):
-    prompt = generate_serum_prompt(request.text)
-    logger.debug(f"Generated Serum prompt: {prompt}")
-    ai_response = await call_lm_studio(prompt)
-    logger.debug(f"AI response: {ai_response}")
+async def _fxp_bytes(text: str) -> bytes:
+    prompt = generate_serum_prompt(text)
+    logger.debug("Generated Serum prompt: %s", prompt)
+    ai_response = await call_lm_studio(prompt, SERUM_MAX_TOK)
+    logger.debug("AI response: %s", ai_response)
     try:
         cleaned_response = clean_json_response(ai_response)
-        logger.debug(f"Cleaned response: {cleaned_response}")
-        serum_data = json.loads(cleaned_response)
-        logger.debug(f"Parsed Serum data: {serum_data}")
-        with NamedTemporaryFile(delete=False, suffix='.fxp') as tmpfile:
-            if create_fxp_file(serum_data, tmpfile.name):
-                tmpfile.flush()
-                return FileResponse(
-                    tmpfile.name,
-                    media_type="application/octet-stream",
-                    filename="generated_serum_preset.fxp"
-                )
-            else:
-                raise HTTPException(status_code=500, detail="Failed to create FXP file")
+        logger.debug("Cleaned response: %s", cleaned_response)
+        serum_data = json_loads(cleaned_response)
+        logger.debug("Parsed Serum data: %s", serum_data)
+        buf = io.BytesIO()
+        if await anyio.to_thread.run_sync(create_fxp_file, serum_data, buf):
+            return buf.getvalue()
+        else:
+            raise HTTPException(status_code=500, detail="Failed to create FXP file")
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse AI response as JSON: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
 
-def generate_3xosc_prompt(text: str) -> str:
-    return f"""Generate a 3x Osc preset for FL Studio in JSON format based on: {text}
+@app.post("/generate/fxp", response_model=None)
+async def generate_fxp(request: TextRequest):
+    return Response(
+        await cached_result("fxp", request.text, _fxp_bytes, request.no_cache),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="generated_serum_preset.fxp"'}
+    )
+
+_OSC_TMPL = """Generate a 3x Osc preset for FL Studio in JSON format based on: {text}
 Only output valid JSON. Do not include comments or explanations.
 Format:
 {{
@@ -373,30 +683,33 @@ Format:
 }}
 """
 
-@app.post("/generate/3xosc")
-async def generate_3xosc(request: TextRequest):
-    prompt = generate_3xosc_prompt(request.text)
-    logger.debug(f"Generated 3xOsc prompt: {prompt}")
-    ai_response = await call_lm_studio(prompt)
-    logger.debug(f"AI response: {ai_response}")
+@lru_cache(maxsize=512)
+def generate_3xosc_prompt(text: str) -> str:
+    return _OSC_TMPL.format(text=text)
+
+async def _3xosc_bytes(text: str) -> bytes:
+    prompt = generate_3xosc_prompt(text)
+    logger.debug("Generated 3xOsc prompt: %s", prompt)
+    ai_response = await call_lm_studio(prompt, OSC_MAX_TOK)
+    logger.debug("AI response: %s", ai_response)
     try:
         cleaned_response = clean_json_response(ai_response)
-        cleaned_response = strip_json_comments(cleaned_response)
-        logger.debug(f"Cleaned response (no comments): {cleaned_response}")
-        osc_data = json.loads(cleaned_response)
-        logger.debug(f"Parsed 3xOsc data: {osc_data}")
-        with NamedTemporaryFile(delete=False, suffix='.json') as tmpfile:
-            tmpfile.write(json.dumps(osc_data, indent=2).encode())
-            tmpfile.flush()
-            return FileResponse(
-                tmpfile.name,
-                media_type="application/json",
-                filename="generated_3xosc_preset.json"
-            )
+        logger.debug("Cleaned response (no comments): %s", cleaned_response)
+        # Parse only to validate; the cleaned text is returned as-is rather than re-serialized
+        json_loads(cleaned_response)
+        return cleaned_response.encode()
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse AI response as JSON: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
 
+@app.post("/generate/3xosc", response_model=None)
+async def generate_3xosc(request: TextRequest):
+    return Response(
+        await cached_result("3xosc", request.text, _3xosc_bytes, request.no_cache),
+        media_type="application/json",
+        headers={"Content-Disposition": 'attachment; filename="generated_3xosc_preset.json"'}
+    )
+
 # Map waveform names to values (update as needed)
 OSC_WAVEFORM_MAP = {
     "sine": 0,
@@ -432,76 +745,105 @@ OSC_OFFSETS = {
     # Add more as discovered
 }
 
+# Parameters whose values may be given as waveform names
+_OSC_WAVEFORM_KEYS = frozenset(key for key in OSC_OFFSETS if 'waveform' in key)
+
 TEMPLATE_FST = 'presets/3xosc/3xosc_preset_default.fst'
 
-def create_3xosc_fst(params, output_path, template_path=TEMPLATE_FST):
+@lru_cache(maxsize=None)
+def _read_template(template_path: str) -> bytes:
+    # Template presets never change while the server runs, so read each one from disk once
     with open(template_path, 'rb') as f:
-        data = bytearray(f.read())
-    # Set parameters at known offsets
-    for key, offset in OSC_OFFSETS.items():
-        value = params.get(key)
+        return f.read()
+
+def create_3xosc_fst(params, fp, template_path=TEMPLATE_FST):
+    data = bytearray(_read_template(template_path))
+    # Set parameters at known offsets, visiting only the keys the AI actually supplied
+    for key in params.keys() & OSC_OFFSETS.keys():
+        value = params[key]
         if value is not None:
+            offset = OSC_OFFSETS[key]
             # Map waveform names to values
-            if 'waveform' in key and isinstance(value, str):
+            if key in _OSC_WAVEFORM_KEYS and isinstance(value, str):
                 value = OSC_WAVEFORM_MAP.get(value.lower(), 0)
             # Clamp to 0-255
             value = max(0, min(255, int(value)))
             data[offset] = value
-            logger.debug(f"Set {key} (offset {offset}) to {value}")
-    with open(output_path, 'wb') as f:
-        f.write(data)
-    logger.info(f"Wrote 3xOsc FST file: {output_path}")
+            logger.debug("Set %s (offset %s) to %s", key, offset, value)
+    fp.write(data)
 
-@app.post("/generate/3xosc-fst")
-async def generate_3xosc_fst(request: TextRequest):
-    prompt = (
-        "Generate a 3x Osc preset for FL Studio as JSON. "
-        "Only output valid JSON. Do not include comments or explanations. "
-        "Format: {\n"
-        "  \"osc1_waveform\": \"sine|triangle|saw|square|noise\",\n"
-        "  \"osc1_coarse\": 0,\n"
-        "  \"osc1_fine\": 0,\n"
-        "  \"osc1_volume\": 127,\n"
-        "  \"osc1_phase\": 0,\n"
-        "  \"osc1_detune\": 0,\n"
-        "  \"osc2_waveform\": \"sine|triangle|saw|square|noise\",\n"
-        "  \"osc2_coarse\": 0,\n"
-        "  \"osc2_fine\": 0,\n"
-        "  \"osc2_volume\": 127,\n"
-        "  \"osc2_phase\": 0,\n"
-        "  \"osc2_detune\": 0,\n"
-        "  \"osc3_waveform\": \"sine|triangle|saw|square|noise\",\n"
-        "  \"osc3_coarse\": 0,\n"
-        "  \"osc3_fine\": 0,\n"
-        "  \"osc3_volume\": 127,\n"
-        "  \"osc3_phase\": 0,\n"
-        "  \"osc3_detune\": 0,\n"
-        "  \"mix_osc1\": 85,\n"
-        "  \"mix_osc2\": 85,\n"
-        "  \"mix_osc3\": 85\n"
-        "}"
-    ) + f"\nPreset description: {request.text}"
-    logger.debug(f"Generated 3xOsc FST prompt: {prompt}")
-    ai_response = await call_lm_studio(prompt)
-    logger.debug(f"AI response: {ai_response}")
+_OSC_FST_PROMPT = (
+    "Generate a 3x Osc preset for FL Studio as JSON. "
+    "Only output valid JSON. Do not include comments or explanations. "
+    "Format: {\n"
+    "  \"osc1_waveform\": \"sine|triangle|saw|square|noise\",\n"
+    "  \"osc1_coarse\": 0,\n"
+    "  \"osc1_fine\": 0,\n"
+    "  \"osc1_volume\": 127,\n"
+    "  \"osc1_phase\": 0,\n"
+    "  \"osc1_detune\": 0,\n"
+    "  \"osc2_waveform\": \"sine|triangle|saw|square|noise\",\n"
+    "  \"osc2_coarse\": 0,\n"
+    "  \"osc2_fine\": 0,\n"
+    "  \"osc2_volume\": 127,\n"
+    "  \"osc2_phase\": 0,\n"
+    "  \"osc2_detune\": 0,\n"
+    "  \"osc3_waveform\": \"sine|triangle|saw|square|noise\",\n"
+    "  \"osc3_coarse\": 0,\n"
+    "  \"osc3_fine\": 0,\n"
+    "  \"osc3_volume\": 127,\n"
+    "  \"osc3_phase\": 0,\n"
+    "  \"osc3_detune\": 0,\n"
+    "  \"mix_osc1\": 85,\n"
+    "  \"mix_osc2\": 85,\n"
+    "  \"mix_osc3\": 85\n"
+    "}"
+)
+
+@lru_cache(maxsize=512)
+def generate_3xosc_fst_prompt(text: str) -> str:
+    return f"{_OSC_FST_PROMPT}\nPreset description: {text}"
+
+async def _3xosc_fst_bytes(text: str) -> bytes:
+    prompt = generate_3xosc_fst_prompt(text)
+    logger.debug("Generated 3xOsc FST prompt: %s", prompt)
+    ai_response = await call_lm_studio(prompt, OSC_MAX_TOK)
+    logger.debug("AI response: %s", ai_response)
     try:
         cleaned_response = clean_json_response(ai_response)
-        cleaned_response = strip_json_comments(cleaned_response)
-        logger.debug(f"Cleaned response (no comments): {cleaned_response}")
-        osc_data = json.loads(cleaned_response)
-        logger.info(f"AI 3xOsc JSON: {osc_data}")
-        with NamedTemporaryFile(delete=False, suffix='.fst') as tmpfile:
-            create_3xosc_fst(osc_data, tmpfile.name)
-            tmpfile.flush()
-            logger.info(f"Generated 3xOsc FST file at {tmpfile.name}")
-            return FileResponse(
-                tmpfile.name,
-                media_type="application/octet-stream",
-                filename="generated_3xosc_preset.fst"
-            )
+        logger.debug("Cleaned response (no comments): %s", cleaned_response)
+        osc_data = json_loads(cleaned_response)
+        logger.debug("AI 3xOsc JSON: %s", osc_data)
+        buf = io.BytesIO()
+        await anyio.to_thread.run_sync(create_3xosc_fst, osc_data, buf)
+        logger.info("Generated 3xOsc FST file (%s bytes)", buf.tell())
+        return buf.getvalue()
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse AI response as JSON: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Invalid JSON response from AI: {str(e)}")
 
+@app.post("/generate/3xosc-fst", response_model=None)
+async def generate_3xosc_fst(request: TextRequest):
+    return Response(
+        await cached_result("3xosc-fst", request.text, _3xosc_fst_bytes, request.no_cache),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": 'attachment; filename="generated_3xosc_preset.fst"'}
+    )
+
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
+    # uvloop is Unix-only; fall back to the stock asyncio loop / h11 parser when unavailable
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "asyncio"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "h11"
+    # Every endpoint is async and waits on a single LM Studio, so one worker is enough; extra
+    # workers would each keep their own in-flight map, result cache and connection pool.
+    # Multiple workers need the app passed as an import string
+    workers = int(os.environ.get("WORKERS", 1))
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, loop=loop, http=http, workers=workers) 
\ No newline at end of file
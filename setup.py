@@ -0,0 +1,10 @@
+# Builds the optional compiled MIDI note encoder next to server.py:
+#   python setup.py build_ext --inplace
+# server.py falls back to the pure-Python encoder when the extension isn't built.
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="flstudio_llm",
+    ext_modules=cythonize("_midi_core.pyx", language_level=3),
+)
@@ -0,0 +1,71 @@
+import io
+
+import pytest
+
+mido = pytest.importorskip("mido")
+server = pytest.importorskip("server")
+
+DOCS = [
+    {"tempo": 120, "notes": []},
+    {
+        "tempo": 96.5,
+        "time_signature": [3, 4],
+        "notes": [
+            {"pitch": 60, "velocity": 100, "start": 0, "duration": 1},
+            {"pitch": 64, "velocity": 90, "start": 1, "duration": 0.5},
+            {"pitch": 67, "velocity": 80, "start": 1.5, "duration": 2.25},
+        ],
+    },
+    {
+        # Out of order, overlapping, and long enough gaps to need multi-byte VLQs
+        "tempo": 60,
+        "time_signature": [7, 8],
+        "notes": [
+            {"pitch": 72, "velocity": 127, "start": 40, "duration": 300},
+            {"pitch": 0, "velocity": 1, "start": 0, "duration": 0},
+            {"pitch": 127, "velocity": 64, "start": 0.25, "duration": 3},
+            {"pitch": 48, "velocity": 70, "start": 1, "duration": 0.1},
+        ],
+    },
+]
+
+
+def mido_reference(midi_data):
+    # Track construction as json_to_midi did it with mido before emit_midi replaced it
+    mid = mido.MidiFile(ticks_per_beat=server.MIDI_TICKS_PER_BEAT)
+    track = mido.MidiTrack()
+    mid.tracks.append(track)
+    track.append(mido.MetaMessage('set_tempo', tempo=mido.bpm2tempo(midi_data.get('tempo', 120))))
+    ts = midi_data.get('time_signature', [4, 4])
+    track.append(mido.MetaMessage('time_signature', numerator=ts[0], denominator=ts[1]))
+    ticks_per_beat = mid.ticks_per_beat
+    last_tick = 0
+    for note in sorted(midi_data['notes'], key=lambda n: n.get('start', 0)):
+        start_tick = int(note.get('start', 0) * ticks_per_beat)
+        duration_tick = int(note.get('duration', 1) * ticks_per_beat)
+        delta = max(0, start_tick - last_tick)
+        track.append(mido.Message('note_on', note=note['pitch'], velocity=note['velocity'], time=delta))
+        track.append(mido.Message('note_off', note=note['pitch'], velocity=0, time=duration_tick))
+        last_tick = start_tick + duration_tick
+    buf = io.BytesIO()
+    mid.save(file=buf)
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("midi_data", DOCS)
+def test_json_to_midi_matches_mido(midi_data):
+    buf = io.BytesIO()
+    server.json_to_midi(server.MidiDoc.model_validate(midi_data), buf)
+    assert buf.getvalue() == mido_reference(midi_data)
+
+
+@pytest.mark.parametrize("events", [
+    [],
+    [(0, 480, 60, 100), (480, 240, 64, 90)],
+    [(0, 0, 0, 1), (120, 1440, 127, 64), (100, 48, 48, 70), (19200, 144000, 72, 127)],
+    [(0, 0x0FFFFFFF, 60, 100), (0x0FFFFFFF + 0x80, 0x3FFF, 61, 101)],
+])
+def test_compiled_encoder_matches_fallback(events):
+    if server.encode_note_events is server._encode_note_events:
+        pytest.skip("_midi_core is not built")
+    assert server.encode_note_events(events) == server._encode_note_events(events)